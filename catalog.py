@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from models import CatalogVersion, Question
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Serialises catalog reloads; the read path never takes it.
+CATALOG_LOCK = threading.RLock()
+
+_NO_MAX_AGE = 10**9
+
+# Every gender /next-question accepts; what target_gender "All" expands to.
+ALL_GENDERS = frozenset(("Male", "Female", "Intersex"))
+
+@dataclass(frozen=True)
+class CatalogQuestion:
+    """Plain, immutable copy of a Question row. The cache outlives the Session
+    that loaded it, so it holds these rather than detached ORM instances."""
+    id: str
+    sequence: int
+    section: str
+    sub_section: str
+    text: str
+    type: str
+    options: Optional[List[str]]
+    required: bool
+    target_gender: Optional[str]
+    target_age_range: Optional[str]
+    info_tooltip: Optional[str]
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Everything request handlers need from the question catalog, built
+    together by load_catalog(). A handler reads current_catalog() once and uses
+    that snapshot throughout, so a concurrent reload can never mix, say, new
+    answer bit numbering with candidate masks built for the old one."""
+    # catalog_version.version the snapshot was loaded at; 0 before the first bump
+    version: int
+    questions: tuple
+    by_id: dict
+    answer_bits: dict
+    # Questions whose answers some dependency tests
+    dependency_source_ids: frozenset
+    candidates: Callable[[str, int], tuple]
+    required_ids: frozenset
+
+@lru_cache(maxsize=64)
+def parse_age_range(age_range: Optional[str]) -> Tuple[int, int]:
+    # Only a handful of distinct ranges exist ("Any", "18-40", "50+", ...), so
+    # each one is parsed once and the (min, max) bounds reused afterwards.
+    if age_range is None:
+        return 1, 0  # a blank CSV cell is stored as NULL; treated as unrecognised
+    if age_range == "Any":
+        return 0, _NO_MAX_AGE
+    if "-" in age_range:
+        min_age, max_age = map(int, age_range.split("-"))
+        return min_age, max_age
+    if "+" in age_range:
+        return int(age_range.replace("+", "")), _NO_MAX_AGE
+    return 1, 0  # unrecognised ranges never match
+
+def build_answer_bits(deps_by_qid: dict) -> dict:
+    """Give every (question_id, answer) pair that some dependency refers to its
+    own bit, so a patient's answers fold into one int mask per request."""
+    pairs = sorted({pair for deps in deps_by_qid.values() for pair in deps})
+    return {pair: 1 << index for index, pair in enumerate(pairs)}
+
+def build_rule(question: CatalogQuestion, deps: tuple, answer_bits: dict) -> tuple:
+    """Reduce a question's targeting to plain data checked inline per request:
+    (question, allowed genders, min age, max age, needed answer bits). The
+    question is eligible when the gender is in the set, the age is within the
+    bounds and every needed bit is set in the patient's answer mask."""
+    genders = ALL_GENDERS if question.target_gender == "All" else frozenset((question.target_gender,))
+    min_age, max_age = parse_age_range(question.target_age_range)
+    needed = 0
+    for pair in deps:
+        needed |= answer_bits[pair]
+    return question, genders, min_age, max_age, needed
+
+def make_candidate_lookup(rules: tuple):
+    """Memoised candidates(gender, age) -> ((question, needed answer bits), ...)
+    for the questions a patient of that gender and age can ever be shown, in
+    sequence order. Gender and age are fixed for a patient, so only the
+    dependency check is left per request. Built afresh on every catalog load,
+    so a reload never serves entries computed from the old catalog."""
+    @lru_cache(maxsize=1024)
+    def candidates(gender: str, age: int) -> tuple:
+        return tuple(
+            (question, needed)
+            for question, genders, min_age, max_age, needed in rules
+            if gender in genders and min_age <= age <= max_age
+        )
+
+    return candidates
+
+# Questions and their dependencies are loaded from the CSV at startup and change
+# only through load_csv_to_db(), so request handlers read them from this
+# in-process snapshot instead of querying the database. Replaced by load_catalog().
+_current = CatalogSnapshot(
+    version=-1,
+    questions=(),
+    by_id={},
+    answer_bits={},
+    dependency_source_ids=frozenset(),
+    candidates=make_candidate_lookup(()),
+    required_ids=frozenset()
+)
+
+SELECT_CATALOG_VERSION = select(CatalogVersion.version).where(CatalogVersion.id == 1)
+
+# Each worker caches its own snapshot, so one that did not serve the reload
+# notices the bumped version within this many seconds.
+CATALOG_CHECK_SECONDS = float(os.getenv("CATALOG_CHECK_SECONDS", "1"))
+_next_version_check = 0.0
+
+def load_catalog(db: Session):
+    with CATALOG_LOCK:
+        # Read before the questions: a reload committed in between leaves this
+        # snapshot looking stale, so the next check loads it again.
+        version = db.execute(SELECT_CATALOG_VERSION).scalar() or 0
+        # selectinload fetches every question's dependencies in one IN query, so
+        # reading question.dependencies below never goes back to the database.
+        rows = db.query(Question).options(selectinload(Question.dependencies)).all()
+        # Sorted once here; every reader iterates this tuple in sequence order.
+        questions = tuple(sorted(
+            (CatalogQuestion(
+                id=q.id,
+                sequence=q.sequence,
+                section=q.section,
+                sub_section=q.sub_section,
+                text=q.text,
+                type=q.type,
+                options=q.options,
+                required=q.required,
+                target_gender=q.target_gender,
+                target_age_range=q.target_age_range,
+                info_tooltip=q.info_tooltip
+            ) for q in rows),
+            key=lambda q: q.sequence
+        ))
+        # question_id -> ((depends_on_question_id, depends_on_answer), ...)
+        deps_by_qid = {
+            q.id: tuple((dep.depends_on_question_id, dep.depends_on_answer) for dep in q.dependencies)
+            for q in rows if q.dependencies
+        }
+        answer_bits = build_answer_bits(deps_by_qid)
+        rules = tuple(build_rule(q, deps_by_qid.get(q.id, ()), answer_bits) for q in questions)
+        snapshot = CatalogSnapshot(
+            version=version,
+            questions=questions,
+            by_id={q.id: q for q in questions},
+            answer_bits=answer_bits,
+            dependency_source_ids=frozenset(qid for qid, _ in answer_bits),
+            candidates=make_candidate_lookup(rules),
+            required_ids=frozenset(q.id for q in questions if q.required)
+        )
+        # Published with a single assignment, so readers get either the old
+        # snapshot or the new one, never a mix.
+        global _current
+        _current = snapshot
+        logger.info("Question catalog loaded: %d questions, %d with dependencies", len(questions), len(deps_by_qid))
+
+def current_catalog() -> CatalogSnapshot:
+    return _current
+
+def refresh_catalog(db: Session) -> CatalogSnapshot:
+    """Return the current snapshot, first reloading it if another worker has
+    rewritten the questions since it was built. The version is read at most once
+    every CATALOG_CHECK_SECONDS, so most calls never touch the database."""
+    global _next_version_check
+    now = time.monotonic()
+    if now >= _next_version_check:
+        _next_version_check = now + CATALOG_CHECK_SECONDS
+        version = db.execute(SELECT_CATALOG_VERSION).scalar() or 0
+        if version != _current.version:
+            with CATALOG_LOCK:
+                # Another request may have reloaded while this one waited.
+                if version != _current.version:
+                    logger.info("Question catalog version changed to %d, reloading.", version)
+                    load_catalog(db)
+    return _current
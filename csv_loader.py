@@ -1,74 +1,178 @@
 import csv
-from sqlalchemy.orm import Session
+import io
+import json
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine
 from sqlalchemy.sql import text
-from models import Question, QuestionDependency
+from models import CatalogVersion, Question, QuestionDependency
+from database import SCHEMA_LOCK, SCHEMA_LOCK_KEY
 import logging
+import re
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_csv_to_db(db: Session, csv_file: str):
+# The questionnaire as shipped in Refined_Cancer_Risk_Questionnaire.csv.
+_EXPECTED_COUNT = 23
+_EXPECTED_IDS = tuple(f"Q{i}" for i in range(1, _EXPECTED_COUNT + 1))
+
+# "Show if Q3 = 'Yes'" -> ("Q3", "Yes"); tolerant of extra whitespace and
+# missing quotes.
+_COND_RE = re.compile(r"^\s*Show if\s+(\S+)\s*=\s*'?([^']+?)'?\s*$")
+
+# NULL marker for COPY; unlike the CSV default of '' it cannot collide with an
+# empty string, which NOT NULL text columns must keep.
+_COPY_NULL = r"\N"
+
+# Set once this process has verified or loaded the questions table, so repeat
+# calls skip the database round-trips entirely.
+_csv_loaded: bool = False
+
+def _read_csv_rows(csv_file: str):
+    """Parse the questionnaire CSV into plain row dicts for the questions and
+    question_dependencies tables. The file is read in one go and closed before
+    any rows are written."""
+    with open(csv_file, newline='') as f:
+        rows = list(csv.DictReader(f))
+
+    q_rows = []
+    dep_rows = []
+    for index, row in enumerate(rows, 1):
+        q_rows.append({
+            "id": row["Question ID"],
+            "sequence": index,
+            "section": row["Section"],
+            "sub_section": row["Sub-section"],
+            "text": row["Question Text"],
+            "type": row["Question Type"],
+            "options": row["Options"].split(";") if row["Options"] else None,
+            "required": row["Required"] == "Yes",
+            "target_gender": row["Target Gender"] or None,
+            "target_age_range": row["Target Age Range"] or None,
+            "info_tooltip": row["Info Tooltip"] or None
+        })
+
+        match = _COND_RE.match(row["Conditional Logic"] or "")
+        if match:
+            dep_question_id, dep_answer = match.group(1), match.group(2)
+            dep_rows.append({
+                "question_id": row["Question ID"],
+                "depends_on_question_id": dep_question_id,
+                "depends_on_answer": dep_answer
+            })
+    return q_rows, dep_rows
+
+def _copy_rows(cursor, table: str, rows: list):
+    """Bulk load row dicts into table with COPY FROM STDIN. None is written as
+    the \\N marker and loads as SQL NULL, so empty strings stay empty strings;
+    lists are written as JSON and booleans as t/f."""
+    if not rows:
+        return
+    columns = list(rows[0])
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        values = []
+        for column in columns:
+            value = row[column]
+            if value is None:
+                value = _COPY_NULL
+            elif isinstance(value, list):
+                value = json.dumps(value)
+            elif isinstance(value, bool):
+                value = "t" if value else "f"
+            values.append(value)
+        writer.writerow(values)
+    buf.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{_COPY_NULL}')",
+        buf
+    )
+
+# Questions dropped from the CSV; ones that patients have already answered
+# stay, since deleting them would violate patient_answers' foreign key.
+_DELETE_UNUSED_STALE_QUESTIONS = text(
+    "DELETE FROM questions q WHERE NOT (q.id = ANY(:ids)) "
+    "AND NOT EXISTS (SELECT 1 FROM patient_answers a WHERE a.question_id = q.id)"
+)
+
+def _upsert_questions(conn, q_rows: list):
+    """Insert question rows, overwriting every column of any existing row with
+    the same id."""
+    stmt = pg_insert(Question.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["id"],
+        set_={column: stmt.excluded[column] for column in q_rows[0] if column != "id"}
+    )
+    conn.execute(stmt, q_rows)
+
+def _bump_catalog_version(conn):
+    stmt = pg_insert(CatalogVersion).values(id=1, version=1)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[CatalogVersion.id],
+        set_={"version": CatalogVersion.version + 1}
+    ))
+
+def load_csv_to_db(engine: Engine, csv_file: str, force: bool = False):
+    # force reloads the questions and dependencies from the CSV even when the
+    # stored catalog already looks complete, so edits to question content apply.
+    global _csv_loaded
+    if _csv_loaded and not force:
+        logger.info("Questions already verified in this process, skipping CSV load.")
+        return
     logger.info(f"Loading CSV from {csv_file}")
     try:
-        stored_questions = db.query(Question).order_by(Question.sequence).all()
-        stored_ids = [q.id for q in stored_questions]
-        expected_ids = [f"Q{i}" for i in range(1, 24)]
-        expected_count = 23
-
-        if len(stored_questions) == expected_count and stored_ids == expected_ids:
-            logger.info("Questions table already contains correct data, skipping CSV load.")
-            return
-
-        if stored_questions:
-            logger.info("Incorrect or incomplete questions data, truncating questions and dependencies.")
-            db.execute(text("TRUNCATE TABLE questions, question_dependencies RESTART IDENTITY"))
-            db.commit()
-
-        with open(csv_file, newline='') as f:
-            reader = csv.DictReader(f)
-            question_ids = []
-            for index, row in enumerate(reader, 1):
-                logger.info(f"Processing question {row['Question ID']} (sequence {index})")
-                question = Question(
-                    id=row["Question ID"],
-                    sequence=index,
-                    section=row["Section"],
-                    sub_section=row["Sub-section"],
-                    text=row["Question Text"],
-                    type=row["Question Type"],
-                    options=row["Options"].split(";") if row["Options"] else None,
-                    required=row["Required"] == "Yes",
-                    # required = "Yes" if row["Required"] == "Yes" else str(row["Required"]),
-                    target_gender=row["Target Gender"] or None,
-                    target_age_range=row["Target Age Range"] or None,
-                    info_tooltip=row["Info Tooltip"] or None
-                )
-                db.merge(question)
-                question_ids.append(row["Question ID"])
-
-                if row["Conditional Logic"]:
-                    logic = row["Conditional Logic"].replace("Show if ", "")
-                    if "=" in logic:
-                        dep_question_id, dep_answer = logic.split(" = ")
-                        dep_answer = dep_answer.strip("'")
-                        dependency = QuestionDependency(
-                            question_id=row["Question ID"],
-                            depends_on_question_id=dep_question_id,
-                            depends_on_answer=dep_answer
-                        )
-                        db.merge(dependency)
-                
-                db.commit()
-
-            logger.info("CSV data committed to database.")
-            stored_questions = db.query(Question).order_by(Question.sequence).all()
-            stored_ids = [q.id for q in stored_questions]
-            logger.info(f"Stored question IDs: {stored_ids}")
-            if stored_ids != question_ids:
-                logger.warning(f"Question order mismatch. Expected: {question_ids}, Got: {stored_ids}")
-            else:
-                logger.info("Question order verified successfully.")
+        # Core statements on a plain connection: this is a pure bulk-write job and
+        # needs none of the Session's identity map or unit-of-work bookkeeping.
+        # engine.begin() commits once on exit and rolls back on any error.
+        with engine.begin() as conn:
+            # Workers booting together would otherwise all see an empty table and
+            # race to load it.
+            conn.execute(SCHEMA_LOCK, {"key": SCHEMA_LOCK_KEY})
+            # Scalar queries only: nothing is hydrated on the common no-op path.
+            stored_count = conn.execute(select(func.count()).select_from(Question)).scalar()
+            if stored_count == _EXPECTED_COUNT and not force:
+                stored_ids = conn.execute(select(Question.id).order_by(Question.sequence)).scalars().all()
+                if tuple(stored_ids) == _EXPECTED_IDS:
+                    logger.info("Questions table already contains correct data, skipping CSV load.")
+                    _csv_loaded = True
+                    return
+
+            q_rows, dep_rows = _read_csv_rows(csv_file)
+            question_ids = [row["id"] for row in q_rows]
+
+            # Everything below shares one transaction, so a failed load never
+            # leaves the tables half-populated. Dependencies go in after their
+            # parent questions for FK integrity.
+            cursor = conn.connection.cursor()
+            try:
+                if stored_count:
+                    # patient_answers references questions, so rows in use cannot be
+                    # deleted; questions are updated in place by id instead. Nothing
+                    # references question_dependencies, so those are simply reloaded.
+                    logger.info("Incorrect or incomplete questions data, updating questions and dependencies.")
+                    conn.execute(text("DELETE FROM question_dependencies"))
+                    _upsert_questions(conn, q_rows)
+                    conn.execute(_DELETE_UNUSED_STALE_QUESTIONS, {"ids": question_ids})
+                else:
+                    # Fresh database: a pure bulk load, where COPY skips per-row
+                    # parsing and planning entirely.
+                    _copy_rows(cursor, Question.__tablename__, q_rows)
+                _copy_rows(cursor, QuestionDependency.__tablename__, dep_rows)
+            finally:
+                cursor.close()
+            # Tells the other workers to reload their catalogs.
+            _bump_catalog_version(conn)
+
+            logger.info("Loaded %d questions, %d dependencies", len(q_rows), len(dep_rows))
+            stored_ids = list(conn.execute(select(Question.id).order_by(Question.sequence)).scalars())
+        logger.info(f"Stored question IDs: {stored_ids}")
+        if stored_ids != question_ids:
+            logger.warning(f"Question order mismatch. Expected: {question_ids}, Got: {stored_ids}")
+        else:
+            logger.info("Question order verified successfully.")
+        _csv_loaded = True
     except Exception as e:
         logger.error(f"Error loading CSV: {e}")
-        db.rollback()
         raise
\ No newline at end of file
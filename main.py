@@ -1,50 +1,134 @@
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Depends, Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import text
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import Dict, List, Optional
-from models import Question, QuestionDependency, PatientAnswer
-from database import get_db, Base, engine, SessionLocal
+from models import PatientAnswer
+from database import get_db, Base, engine, SessionLocal, verify_connection, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_USE_PGBOUNCER, SCHEMA_LOCK, SCHEMA_LOCK_KEY
 from csv_loader import load_csv_to_db
+from catalog import CATALOG_LOCK, current_catalog, load_catalog, refresh_catalog
 import os
+import asyncio
+import signal
 import logging
-import json
-from sqlalchemy import desc, func
+import orjson
+import anyio
+import gzip
+import hashlib
+import hmac
+from sqlalchemy import JSON, bindparam, inspect, select
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+# Set once the question catalog has been loaded; see start_question_load().
+app.state.ready = False
+
+CSV_PATH = "Refined_Cancer_Risk_Questionnaire.csv"
+# Background catalog load attempts before the worker gives up and exits.
+QUESTION_LOAD_ATTEMPTS = int(os.getenv("QUESTION_LOAD_ATTEMPTS", "5"))
+# Resolved from this file rather than the working directory: the pages are
+# read at import time, which must work however the app is launched.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+@app.on_event("startup")
+async def size_threadpool():
+    # The sync endpoints run in AnyIO's worker threads, 40 by default. Allow as
+    # many threads as the pool has connections so a larger pool is not capped
+    # by the thread count; beyond that extra threads would only queue for a
+    # connection.
+    if not DB_USE_PGBOUNCER:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        limiter.total_tokens = max(limiter.total_tokens, DB_POOL_SIZE + DB_MAX_OVERFLOW)
+        logger.info(f"Threadpool size: {limiter.total_tokens}")
 
 @app.on_event("startup")
 def on_startup():
     logger.info("Starting up and creating database tables...")
     try:
-        Base.metadata.create_all(bind=engine)
+        verify_connection()
+        # Every worker runs this on boot. The transaction-scoped advisory lock
+        # makes concurrent workers take turns, so only the first one creates
+        # anything and the rest find it already in place.
+        with engine.begin() as conn:
+            conn.execute(SCHEMA_LOCK, {"key": SCHEMA_LOCK_KEY})
+            Base.metadata.create_all(bind=conn)
+            # create_all() skips tables that already exist, so add any indexes that
+            # were introduced after the table was first created. Older versions could
+            # store the same question twice for a patient; keep only the newest row
+            # so the unique answer index can be built.
+            existing_indexes = {ix["name"] for ix in inspect(conn).get_indexes("patient_answers")}
+            if "uq_patient_question" not in existing_indexes:
+                conn.execute(text(
+                    "DELETE FROM patient_answers a USING patient_answers b "
+                    "WHERE a.patient_id = b.patient_id AND a.question_id = b.question_id AND a.id < b.id"
+                ))
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(bind=conn, checkfirst=True)
         logger.info(f"Tables registered with metadata: {Base.metadata.tables.keys()}")
-        with engine.connect() as conn:
-            result = conn.execute(text("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'questions')"))
-            table_exists = result.scalar()
-            if table_exists:
-                logger.info("Table 'questions' exists.")
-            else:
-                logger.error("Table 'questions' was not created.")
-                raise Exception("Failed to create 'questions' table.")
-        
         logger.info("Tables created successfully.")
-        csv_path = "Refined_Cancer_Risk_Questionnaire.csv"
-        if os.path.exists(csv_path):
-            with SessionLocal() as db:
-                load_csv_to_db(db, csv_path)
-                logger.info("CSV data loaded successfully.")
-        else:
-            logger.error(f"CSV file not found at {csv_path}")
-            raise FileNotFoundError(f"CSV file not found: {csv_path}")
+        if not os.path.exists(CSV_PATH):
+            logger.error(f"CSV file not found at {CSV_PATH}")
+            raise FileNotFoundError(f"CSV file not found: {CSV_PATH}")
     except Exception as e:
         logger.error(f"Error during startup: {e}")
         raise
 
+def load_questions():
+    # Already populated databases cost one COUNT and one id query here; the CSV
+    # is only parsed when the questions table needs (re)loading.
+    load_csv_to_db(engine, CSV_PATH)
+    logger.info("CSV data loaded successfully.")
+    with SessionLocal() as db:
+        load_catalog(db)
+
+async def load_questions_in_background():
+    delay = 1
+    for attempt in range(1, QUESTION_LOAD_ATTEMPTS + 1):
+        try:
+            await anyio.to_thread.run_sync(load_questions)
+            app.state.ready = True
+            logger.info("Question catalog ready.")
+            return
+        except Exception as e:
+            logger.error(f"Error loading questions (attempt {attempt}/{QUESTION_LOAD_ATTEMPTS}): {e}")
+            if attempt < QUESTION_LOAD_ATTEMPTS:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+    # Out of retries: stop the worker as a failed startup would, instead of
+    # serving 503s indefinitely; the process manager restarts or reports it.
+    logger.critical("Question catalog could not be loaded, shutting down.")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+@app.on_event("startup")
+async def start_question_load():
+    # The questions load after startup completes, so the server accepts
+    # connections (and serves the static pages) straight away; endpoints that
+    # need the catalog answer 503 until it is in place.
+    app.state.question_load = asyncio.create_task(load_questions_in_background())
+
+@app.get("/health")
+async def health():
+    # Liveness: the process is up and serving.
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    # Readiness: 503 until the question catalog is loaded, so orchestrators
+    # hold traffic back from a worker that is still starting.
+    if not app.state.ready:
+        return ORJSONResponse({"ready": False}, status_code=503)
+    return {"ready": True}
+
+async def require_ready():
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail="Question catalog is still loading", headers={"Retry-After": "5"})
+
 # Pydantic models
 class PatientInput(BaseModel):
     patient_id: str
@@ -62,30 +146,61 @@ class QuestionResponse(BaseModel):
 class NextQuestionResponse(BaseModel):
     next_question: Optional[QuestionResponse]
 
-class PatientDetail(BaseModel):
-    question_id: str
-    text: str
-    type: str
-    answer: str
-
-class PatientDetailsResponse(BaseModel):
-    patient_id: str
-    details: List[PatientDetail]
-
-def is_age_in_range(age: int, age_range: str) -> bool:
-    if age_range == "Any":
-        return True
-    if "-" in age_range:
-        min_age, max_age = map(int, age_range.split("-"))
-        return min_age <= age <= max_age
-    if "+" in age_range:
-        min_age = int(age_range.replace("+", ""))
-        return age >= min_age
-    return False
-
-@app.post("/next-question", response_model=NextQuestionResponse)
-def get_next_question(input: PatientInput, db: Session = Depends(get_db)):
+def is_empty_answer(answer) -> bool:
+    return not answer or (isinstance(answer, str) and answer.strip() == "")
+
+# Plain SQL for the per-request answer lookup: two columns, no ORM compilation or
+# row hydration.
+SELECT_ANSWERS = text("SELECT question_id, answer FROM patient_answers WHERE patient_id = :pid")
+
+# Built once at import; each request only binds parameters. Runs as an
+# executemany, which psycopg2's batch mode sends in a single round trip.
+UPSERT_ANSWERS = text(
+    "INSERT INTO patient_answers (patient_id, question_id, answer) "
+    "VALUES (:patient_id, :question_id, :answer) "
+    "ON CONFLICT (patient_id, question_id) DO UPDATE SET answer = EXCLUDED.answer"
+).bindparams(bindparam("answer", type_=JSON))
+
+def upsert_answers(db: Session, patient_id: str, answers: Dict[str, str]):
+    # Insert or overwrite all of a patient's answers in one statement, relying
+    # on the unique (patient_id, question_id) index.
+    if not answers:
+        return
+    db.execute(UPSERT_ANSWERS, [
+        {"patient_id": patient_id, "question_id": qid, "answer": answer}
+        for qid, answer in answers.items()
+    ])
+
+async def parse_patient_input(request: Request) -> PatientInput:
+    # pydantic parses and validates the raw body in one pass, instead of FastAPI
+    # decoding it into a dict first and validating that. Errors keep FastAPI's
+    # usual 422 shape.
     try:
+        return PatientInput.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+# The body is read by parse_patient_input rather than a typed parameter, so its
+# schema is declared here for the OpenAPI docs.
+_PATIENT_INPUT_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": PatientInput.model_json_schema()}}
+    }
+}
+
+@app.post(
+    "/next-question",
+    response_model=NextQuestionResponse,
+    dependencies=[Depends(require_ready)],
+    openapi_extra=_PATIENT_INPUT_BODY
+)
+def get_next_question(input: PatientInput = Depends(parse_patient_input), db: Session = Depends(get_db)):
+    try:
+        # One snapshot for the whole request, whatever reloads happen meanwhile
+        catalog = refresh_catalog(db)
         valid_genders = ["Male", "Female", "Intersex"]
         if input.gender not in valid_genders:
             raise HTTPException(status_code=400, detail=f"Invalid gender. Must be one of {valid_genders}")
@@ -94,8 +209,7 @@ def get_next_question(input: PatientInput, db: Session = Depends(get_db)):
 
         logger.info(f"Processing previous_answers for patient {input.patient_id}: {input.previous_answers}")
 
-        db_answers = db.query(PatientAnswer).filter(PatientAnswer.patient_id == input.patient_id).all()
-        existing_answers = {ans.question_id: ans.answer for ans in db_answers}
+        existing_answers = dict(db.execute(SELECT_ANSWERS, {"pid": input.patient_id}).all())
 
         all_answers = existing_answers.copy()
         all_answers.update(input.previous_answers)
@@ -104,29 +218,25 @@ def get_next_question(input: PatientInput, db: Session = Depends(get_db)):
         all_answers["Q2"] = str(input.age)
 
         # Validate required questions and Q4 when Q3 = 'Yes'
-        questions = db.query(Question).order_by(Question.sequence).all()
-        for question in questions:
-            if question.required and question.id in all_answers:
-                answer = all_answers[question.id]
-                if not answer or (isinstance(answer, str) and answer.strip() == "") or (isinstance(answer, list) and not answer):
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Required question {question.id} ('{question.text}') must have a valid answer."
-                    )
-            elif question.required and question.id not in all_answers:
-                continue
-            if question.id == "Q4" and "Q3" in all_answers and all_answers["Q3"] == "Yes":
-                if question.id in all_answers:
-                    answer = all_answers[question.id]
-                    if not answer or (isinstance(answer, str) and answer.strip() == "") or (isinstance(answer, list) and not answer):
-                        raise HTTPException(
-                            status_code=400,
-                            detail="Required question Q4 ('If yes, what type(s) of cancer did they have?') must have at least one option selected since Q3 is 'Yes'."
-                        )
+        # Only the answers present need checking, not the whole catalog
+        q_by_id = catalog.by_id
+        required_ids = catalog.required_ids
+        for qid, answer in all_answers.items():
+            if qid in required_ids and is_empty_answer(answer):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Required question {qid} ('{q_by_id[qid].text}') must have a valid answer."
+                )
+        if all_answers.get("Q3") == "Yes" and "Q4" in all_answers and is_empty_answer(all_answers["Q4"]):
+            raise HTTPException(
+                status_code=400,
+                detail="Required question Q4 ('If yes, what type(s) of cancer did they have?') must have at least one option selected since Q3 is 'Yes'."
+            )
 
         # Save or update answers
+        prepared = {}
         for qid, answer in input.previous_answers.items():
-            question = db.query(Question).filter(Question.id == qid).first()
+            question = q_by_id.get(qid)
             if not answer or answer.strip() == "":
                 if (question and question.required) or (qid == "Q4" and "Q3" in all_answers and all_answers["Q3"] == "Yes"):
                     logger.warning(f"Empty answer provided for required question {qid}")
@@ -139,75 +249,49 @@ def get_next_question(input: PatientInput, db: Session = Depends(get_db)):
                     answer = "No"
                     logger.info(f"Applying default 'No' for Q5")
                 elif qid == "Q6" and "Q5" in all_answers and all_answers["Q5"] == "Yes":
-                    answer = json.dumps(["Unknown"])
+                    answer = orjson.dumps(["Unknown"]).decode()
                     logger.info(f"Applying default 'Unknown' for Q6")
                 else:
                     answer = "[]" if question and question.type == "Checkbox" else ""
-            existing_answer = db.query(PatientAnswer).filter(
-                PatientAnswer.patient_id == input.patient_id,
-                PatientAnswer.question_id == qid
-            ).first()
-            if existing_answer:
-                existing_answer.answer = json.dumps(answer.split(",")) if "," in str(answer) and question.type == "Checkbox" else answer
-            else:
-                db.add(PatientAnswer(
-                    patient_id=input.patient_id,
-                    question_id=qid,
-                    answer=json.dumps(answer.split(",")) if "," in str(answer) and question.type == "Checkbox" else answer
-                ))
-        # Ensure defaults for Q5/Q6 if they were shown but not answered
-        if "Q5" in all_answers and (not all_answers["Q5"] or all_answers["Q5"].strip() == ""):
-            existing_answer = db.query(PatientAnswer).filter(
-                PatientAnswer.patient_id == input.patient_id,
-                PatientAnswer.question_id == "Q5"
-            ).first()
-            if existing_answer:
-                existing_answer.answer = "No"
-            else:
-                db.add(PatientAnswer(
-                    patient_id=input.patient_id,
-                    question_id="Q5",
-                    answer="No"
-                ))
+            prepared[qid] = orjson.dumps(answer.split(",")).decode() if "," in str(answer) and question.type == "Checkbox" else answer
+        # Ensure defaults for Q5/Q6 if they were shown but not answered, including
+        # answers stored by earlier requests; they join the same single upsert
+        if "Q5" in all_answers and is_empty_answer(all_answers["Q5"]):
+            prepared["Q5"] = "No"
             logger.info(f"Applied default 'No' for Q5 in all_answers")
-        if "Q6" in all_answers and "Q5" in all_answers and all_answers["Q5"] == "Yes" and (not all_answers["Q6"] or all_answers["Q6"].strip() == "" or all_answers["Q6"] == "[]"):
-            existing_answer = db.query(PatientAnswer).filter(
-                PatientAnswer.patient_id == input.patient_id,
-                PatientAnswer.question_id == "Q6"
-            ).first()
-            if existing_answer:
-                existing_answer.answer = json.dumps(["Unknown"])
-            else:
-                db.add(PatientAnswer(
-                    patient_id=input.patient_id,
-                    question_id="Q6",
-                    answer=json.dumps(["Unknown"])
-                ))
+        if "Q6" in all_answers and all_answers.get("Q5") == "Yes" and (is_empty_answer(all_answers["Q6"]) or all_answers["Q6"] == "[]"):
+            prepared["Q6"] = orjson.dumps(["Unknown"]).decode()
             logger.info(f"Applied default 'Unknown' for Q6 in all_answers")
+        # existing_answers already holds what is stored, so rows that would be
+        # rewritten with the same value are left out of the upsert entirely
+        changed = {qid: answer for qid, answer in prepared.items() if existing_answers.get(qid) != answer}
+        upsert_answers(db, input.patient_id, changed)
         db.commit()
 
+        answer_bits = catalog.answer_bits
+
+        # Fold the answers into one bitmask of the (question, value) pairs that
+        # dependencies test, so each eligibility check is a single AND. Only
+        # answers some dependency looks at are decoded.
+        answer_mask = 0
+        for qid in catalog.dependency_source_ids:
+            value = all_answers.get(qid)
+            if value is None:
+                continue
+            values = (
+                orjson.loads(value) if isinstance(value, str) and value.startswith('[')
+                else value.split(",") if "," in str(value)
+                else (value,)
+            )
+            for item in values:
+                answer_mask |= answer_bits.get((qid, item), 0)
+
         answered_ids = set(all_answers.keys())
-        for question in questions:
+        for question, needed in catalog.candidates(input.gender, input.age):
             if question.id in answered_ids:
                 continue
-            if question.target_gender != "All" and question.target_gender != input.gender:
+            if answer_mask & needed != needed:
                 continue
-            if not is_age_in_range(input.age, question.target_age_range):
-                continue
-            dependencies = db.query(QuestionDependency).filter(QuestionDependency.question_id == question.id).all()
-            if dependencies:
-                satisfied = all(
-                    any(dep.depends_on_answer == ans for ans in (
-                        json.loads(all_answers[dep.depends_on_question_id])
-                        if dep.depends_on_question_id in all_answers and isinstance(all_answers[dep.depends_on_question_id], str) and all_answers[dep.depends_on_question_id].startswith('[')
-                        else all_answers.get(dep.depends_on_question_id, "").split(",")
-                        if "," in str(all_answers.get(dep.depends_on_question_id, ""))
-                        else [all_answers.get(dep.depends_on_question_id, "")]
-                    ))
-                    for dep in dependencies
-                )
-                if not satisfied:
-                    continue
             return {
                 "next_question": {
                     "id": question.id,
@@ -222,422 +306,177 @@ def get_next_question(input: PatientInput, db: Session = Depends(get_db)):
         logger.error(f"Error in /next-question: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/get-details/{patient_id}", response_model=PatientDetailsResponse)
-def get_patient_details(patient_id: str, db: Session = Depends(get_db)):
+# Shared secret for /admin endpoints, sent in the X-Admin-Token header. When it
+# is unset the admin endpoints are disabled.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/reload-catalog", dependencies=[Depends(require_admin)])
+def reload_catalog(db: Session = Depends(get_db)):
     try:
-        answers = db.query(PatientAnswer, Question).join(
-            Question, PatientAnswer.question_id == Question.id
-        ).filter(
-            PatientAnswer.patient_id == patient_id
-        ).order_by(Question.sequence).all()
+        with CATALOG_LOCK:
+            load_csv_to_db(engine, CSV_PATH, force=True)
+            load_catalog(db)
+        # Also recovers a worker whose background load at startup failed.
+        app.state.ready = True
+        return {"questions": len(current_catalog().questions)}
+    except Exception as e:
+        logger.error(f"Error in /admin/reload-catalog: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# The read endpoints return ORJSONResponse directly: the rows come straight from
+# our own tables, so response_model re-validation would only cost time.
+# Question text and type come from the cached catalog, so this reads only the
+# answer columns and needs no join against questions.
+SELECT_DETAILS = select(
+    PatientAnswer.question_id, PatientAnswer.answer
+).where(
+    PatientAnswer.patient_id == bindparam("pid")
+)
+
+@app.get("/get-details/{patient_id}", dependencies=[Depends(require_ready)])
+def get_patient_details(patient_id: str):
+    try:
+        # The Session only connects when the version check is due.
+        with SessionLocal() as db:
+            q_by_id = refresh_catalog(db).by_id
+        # Read-only, so a plain pooled connection rather than a Session. At most
+        # one row per question, so the rows are put in questionnaire order from
+        # the cached catalog instead of an ORDER BY.
+        with engine.connect() as conn:
+            answers = conn.execute(SELECT_DETAILS, {"pid": patient_id}).all()
+        # A question the catalog does not know yet sorts last and is listed
+        # without its text rather than failing the whole request.
+        answers.sort(key=lambda answer: q_by_id[answer.question_id].sequence if answer.question_id in q_by_id else float("inf"))
 
         if not answers:
             raise HTTPException(status_code=404, detail=f"No details found for patient ID: {patient_id}")
 
-        details = [
-            PatientDetail(
-                question_id=answer.question_id,
-                text=question.text,
-                type=question.type.lower().replace("checkbox", "multi_select"),
-                answer=answer.answer
-            )
-            for answer, question in answers
-        ]
-
-        return {"patient_id": patient_id, "details": details}
+        details = []
+        for answer in answers:
+            question = q_by_id.get(answer.question_id)
+            details.append({
+                "question_id": answer.question_id,
+                "text": question.text if question else "",
+                "type": question.type.lower().replace("checkbox", "multi_select") if question else "",
+                "answer": answer.answer
+            })
+
+        return ORJSONResponse({"patient_id": patient_id, "details": details})
     except Exception as e:
         logger.error(f"Error in /get-details/{patient_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/get-patient-ids", response_model=List[str])
-def get_patient_ids(db: Session = Depends(get_db)):
+# Newest activity first. DISTINCT ON takes one row per patient straight off
+# ix_patient_created instead of aggregating max(created_at) over every answer.
+_latest_answer = select(
+    PatientAnswer.patient_id, PatientAnswer.created_at
+).distinct(
+    PatientAnswer.patient_id
+).order_by(
+    PatientAnswer.patient_id, PatientAnswer.created_at.desc()
+).subquery()
+SELECT_PATIENT_IDS = select(_latest_answer.c.patient_id).order_by(_latest_answer.c.created_at.desc())
+
+def stream_patient_ids(conn, patient_ids):
+    # Emits a JSON array one server-side cursor batch at a time, so memory stays
+    # flat however many patients there are. Owns conn and closes it when done.
+    try:
+        count = 0
+        yield b"["
+        for batch in patient_ids.partitions():
+            yield (b"," if count else b"") + b",".join(orjson.dumps(pid) for pid in batch)
+            count += len(batch)
+        yield b"]"
+        logger.info(f"Returned {count} patient IDs")
+    finally:
+        conn.close()
+
+@app.get("/get-patient-ids")
+def get_patient_ids():
+    # Uses its own connection rather than get_db(): the rows are read while the
+    # response streams, after request-scoped dependencies have been torn down.
     try:
-        patient_ids = db.query(
-            PatientAnswer.patient_id
-        ).group_by(
-            PatientAnswer.patient_id
-        ).order_by(
-            desc(func.max(PatientAnswer.created_at))
-        ).all()
-        result = [pid for pid, in patient_ids]
-        logger.info(f"Returning patient IDs: {result}")
-        return result
+        conn = engine.connect()
+        try:
+            patient_ids = conn.execution_options(yield_per=500).execute(SELECT_PATIENT_IDS).scalars()
+        except Exception:
+            conn.close()
+            raise
+        return StreamingResponse(stream_patient_ids(conn, patient_ids), media_type="application/json")
     except Exception as e:
         logger.error(f"Error in /get-patient-ids: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/", response_model=None)
-async def get_form():
-    html_content = """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Cancer Risk Questionnaire</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body>
-        <div class="container mt-5">
-            <h1>Cancer Risk Questionnaire</h1>
-            <div class="mb-4">
-                <a href="/history" class="btn btn-info">View Patient History</a>
-            </div>
-            <!-- Questionnaire Form -->
-            <form id="patientForm" class="mt-4">
-                <div class="mb-3">
-                    <label for="patientId" class="form-label">Patient ID</label>
-                    <input type="text" class="form-control" id="patientId" required>
-                </div>
-                <div class="mb-3">
-                    <label for="gender" class="form-label">Biological Sex</label>
-                    <select class="form-select" id="gender" required>
-                        <option value="Male">Male</option>
-                        <option value="Female">Female</option>
-                        <option value="Intersex">Intersex</option>
-                    </select>
-                </div>
-                <div class="mb-3">
-                    <label for="age" class="form-label">Age</label>
-                    <input type="number" class="form-control" id="age" required min="0">
-                </div>
-                <div id="questionContainer" class="mb-3"></div>
-                <button type="submit" class="btn btn-primary" id="nextQuestionBtn">Next Question</button>
-                <button type="button" class="btn btn-warning d-none" id="prevQuestionBtn">Previous Question</button>
-                <button type="button" class="btn btn-success d-none" id="nextPatientBtn">Next Patient</button>
-            </form>
-            <div id="error" class="alert alert-danger d-none mt-3" role="alert"></div>
-        </div>
-        <script>
-            let previousAnswers = {};
-            let currentQuestion = null;
-            let questionHistory = []; // Tracks question IDs in order
-            let questionCache = {}; // Cache question details
-
-            // Populate patient IDs (for Next Patient updates)
-            async function loadPatientIds() {
-                try {
-                    const response = await fetch('/get-patient-ids');
-                    if (!response.ok) {
-                        console.error('Failed to load patient IDs:', await response.text());
-                    }
-                } catch (error) {
-                    console.error('Error loading patient IDs:', error);
-                }
-            }
-
-            // Render question with pre-filled answer
-            function renderQuestion(question, answer) {
-                const questionContainer = document.getElementById('questionContainer');
-                const isQ4Required = question.id === 'Q4' && previousAnswers['Q3'] === 'Yes';
-                questionContainer.dataset.questionId = question.id;
-                questionContainer.innerHTML = `
-                    <label class="form-label">${question.text}${question.required || isQ4Required ? ' <span class="text-danger">*</span>' : ''}</label>
-                    ${question.type === 'multi_select' ? 
-                        question.options.map(opt => {
-                            const isChecked = answer && answer.split(',').includes(opt) ? 'checked' : '';
-                            return `
-                                <div class="form-check">
-                                    <input class="form-check-input" type="checkbox" name="answer" value="${opt}" ${isChecked} ${question.required || isQ4Required ? 'required' : ''}>
-                                    <label class="form-check-label">${opt}</label>
-                                </div>
-                            `;
-                        }).join('') :
-                        question.type === 'text' || question.type === 'number' ?
-                            `<input type="${question.type}" class="form-control" name="answer" value="${answer || ''}" ${question.required ? 'required' : ''}>` :
-                            question.options.map(opt => {
-                                const isChecked = answer === opt ? 'checked' : '';
-                                return `
-                                    <div class="form-check">
-                                        <input class="form-check-input" type="radio" name="answer" value="${opt}" ${isChecked} ${question.required ? 'required' : ''}>
-                                        <label class="form-check-label">${opt}</label>
-                                    </div>
-                                `;
-                            }).join('')}
-                `;
-                // Dynamic required validation for radio/checkbox
-                if ((question.required || isQ4Required) && question.type !== 'text' && question.type !== 'number') {
-                    const inputs = questionContainer.querySelectorAll('input[name="answer"]');
-                    inputs.forEach(input => {
-                        input.addEventListener('change', () => {
-                            const anyChecked = Array.from(inputs).some(inp => inp.checked);
-                            inputs.forEach(inp => inp.required = !anyChecked);
-                        });
-                    });
-                }
-            }
-
-            // Form submission
-            document.getElementById('patientForm').addEventListener('submit', async (e) => {
-                e.preventDefault();
-                const errorDiv = document.getElementById('error');
-                errorDiv.classList.add('d-none');
-
-                const patientId = document.getElementById('patientId').value;
-                const gender = document.getElementById('gender').value;
-                const age = document.getElementById('age').value;
-
-                // Validate patient ID and age
-                if (!patientId.trim()) {
-                    errorDiv.textContent = 'Please enter a valid Patient ID.';
-                    errorDiv.classList.remove('d-none');
-                    return;
-                }
-                if (!age || parseInt(age) < 0) {
-                    errorDiv.textContent = 'Please enter a valid age.';
-                    errorDiv.classList.remove('d-none');
-                    return;
-                }
-
-                previousAnswers['Q1'] = gender;
-                previousAnswers['Q2'] = age.toString();
-
-                let currentAnswer = null;
-                const answerInputs = document.querySelectorAll('input[name="answer"]:checked');
-                if (answerInputs.length > 0) {
-                    currentAnswer = Array.from(answerInputs).map(input => input.value).join(',');
-                } else {
-                    const textInput = document.querySelector('input[name="answer"]');
-                    if (textInput && textInput.value.trim()) {
-                        currentAnswer = textInput.value.trim();
-                    } else if (currentQuestion && !currentQuestion.required && !(currentQuestion.id === 'Q4' && previousAnswers['Q3'] === 'Yes')) {
-                        currentAnswer = '';
-                        console.log(`Sending empty answer for optional question ${currentQuestion.id}`);
-                    }
-                }
-
-                console.log('Current question:', currentQuestion);
-                console.log('Current answer:', currentAnswer);
-
-                // Validate required question or Q4 when Q3 = 'Yes'
-                if (currentQuestion && (currentQuestion.required || (currentQuestion.id === 'Q4' && previousAnswers['Q3'] === 'Yes')) && (currentAnswer === null || currentAnswer === '')) {
-                    errorDiv.textContent = `Please answer the question: "${currentQuestion.text}"`;
-                    errorDiv.classList.remove('d-none');
-                    console.log('Validation failed: Required question not answered.');
-                    return;
-                }
+# The two pages live in static/ and are also served from /static for a CDN or
+# reverse proxy to pick up. Read and gzip them once at import and serve the
+# bytes as-is on every request.
+_STATIC_PAGE_HEADERS = {"Cache-Control": "public, max-age=3600", "Vary": "Accept-Encoding"}
+
+with open(os.path.join(STATIC_DIR, "index.html"), "rb") as f:
+    _FORM_HTML = f.read()
+with open(os.path.join(STATIC_DIR, "history.html"), "rb") as f:
+    _HISTORY_HTML = f.read()
+
+def prepare_static_page(html: bytes) -> dict:
+    # Each encoding gets its own ETag, since the bytes on the wire differ.
+    etag = hashlib.md5(html).hexdigest()
+    return {
+        "identity": (html, f'"{etag}"'),
+        "gzip": (gzip.compress(html, 9), f'"{etag}-gzip"')
+    }
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    # An explicit gzip entry takes precedence over "*"; q=0 means "not acceptable".
+    qvalues = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.lower()] = q
+    return qvalues.get("gzip", qvalues.get("*", 0.0)) > 0
+
+def serve_static_page(request: Request, page: dict) -> Response:
+    encoding = "gzip" if accepts_gzip(request.headers.get("accept-encoding", "")) else "identity"
+    content, etag = page[encoding]
+    headers = {**_STATIC_PAGE_HEADERS, "ETag": etag}
+    if encoding == "gzip":
+        headers["Content-Encoding"] = "gzip"
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="text/html", headers=headers)
+
+_FORM_PAGE = prepare_static_page(_FORM_HTML)
+_HISTORY_PAGE = prepare_static_page(_HISTORY_HTML)
+
+class CachedStaticFiles(StaticFiles):
+    # Same caching policy as the two pages above. Not far-future: the file
+    # names are not versioned, so a deploy has to become visible.
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        response.headers["Cache-Control"] = _STATIC_PAGE_HEADERS["Cache-Control"]
+        return response
+
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
 
-                const currentQuestionId = currentQuestion ? currentQuestion.id : null;
-                if (currentQuestionId && (currentAnswer || currentAnswer === '') && currentQuestionId !== 'Q1' && currentQuestionId !== 'Q2') {
-                    previousAnswers[currentQuestionId] = currentAnswer;
-                    console.log(`Saved answer for ${currentQuestionId}: ${currentAnswer}`);
-                }
-
-                console.log('Sending previous_answers:', previousAnswers);
-
-                try {
-                    const response = await fetch('/next-question', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ patient_id: patientId, gender, age: parseInt(age), previous_answers: previousAnswers })
-                    });
-
-                    if (!response.ok) {
-                        const errorText = await response.text();
-                        errorDiv.textContent = `Error: ${errorText}`;
-                        errorDiv.classList.remove('d-none');
-                        console.error('API error:', errorText);
-                        return;
-                    }
-
-                    const data = await response.json();
-                    console.log('Next question response:', data);
-                    const questionContainer = document.getElementById('questionContainer');
-                    const nextQuestionBtn = document.getElementById('nextQuestionBtn');
-                    const prevQuestionBtn = document.getElementById('prevQuestionBtn');
-                    const nextPatientBtn = document.getElementById('nextPatientBtn');
-                    questionContainer.innerHTML = '';
-                    if (data.next_question && data.next_question.id !== 'Q1' && data.next_question.id !== 'Q2') {
-                        currentQuestion = data.next_question;
-                        questionCache[currentQuestion.id] = currentQuestion; // Cache question
-                        questionHistory.push(currentQuestion.id); // Add to history
-                        renderQuestion(currentQuestion, previousAnswers[currentQuestion.id]);
-                        nextQuestionBtn.classList.remove('d-none');
-                        prevQuestionBtn.classList.toggle('d-none', questionHistory.length <= 1);
-                        nextPatientBtn.classList.add('d-none');
-                    } else {
-                        questionContainer.innerHTML = '<p>No more questions.</p>';
-                        questionContainer.dataset.questionId = '';
-                        nextQuestionBtn.classList.add('d-none');
-                        prevQuestionBtn.classList.toggle('d-none', questionHistory.length <= 1);
-                        nextPatientBtn.classList.remove('d-none');
-                        currentQuestion = null;
-                    }
-                    await loadPatientIds();
-                } catch (error) {
-                    errorDiv.textContent = `Error fetching next question: ${error.message}`;
-                    errorDiv.classList.remove('d-none');
-                    console.error('Fetch error:', error);
-                }
-            });
-
-            // Previous Question button
-            document.getElementById('prevQuestionBtn').addEventListener('click', () => {
-                const errorDiv = document.getElementById('error');
-                errorDiv.classList.add('d-none');
-
-                if (questionHistory.length > 1) {
-                    questionHistory.pop(); // Remove current question
-                    const prevQuestionId = questionHistory[questionHistory.length - 1];
-                    const prevQuestion = questionCache[prevQuestionId];
-                    if (prevQuestion) {
-                        currentQuestion = prevQuestion;
-                        renderQuestion(prevQuestion, previousAnswers[prevQuestionId]);
-                        const questionContainer = document.getElementById('questionContainer');
-                        questionContainer.dataset.questionId = prevQuestionId;
-                        document.getElementById('prevQuestionBtn').classList.toggle('d-none', questionHistory.length <= 1);
-                        document.getElementById('nextQuestionBtn').classList.remove('d-none');
-                        document.getElementById('nextPatientBtn').classList.add('d-none');
-                    }
-                }
-            });
-
-            // Next Patient button
-            document.getElementById('nextPatientBtn').addEventListener('click', async () => {
-                previousAnswers = {};
-                questionHistory = [];
-                questionCache = {};
-                document.getElementById('patientId').value = '';
-                document.getElementById('gender').value = 'Male';
-                document.getElementById('age').value = '';
-                document.getElementById('questionContainer').innerHTML = '';
-                document.getElementById('questionContainer').dataset.questionId = '';
-                document.getElementById('nextQuestionBtn').classList.remove('d-none');
-                document.getElementById('prevQuestionBtn').classList.add('d-none');
-                document.getElementById('nextPatientBtn').classList.add('d-none');
-                document.getElementById('error').classList.add('d-none');
-                currentQuestion = null;
-                await loadPatientIds();
-            });
-
-        </script>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
+@app.get("/", response_model=None)
+async def get_form(request: Request):
+    return serve_static_page(request, _FORM_PAGE)
 
 @app.get("/history", response_model=None)
-async def get_history():
-    html_content = """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Patient History</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body>
-        <div class="container mt-5">
-            <h1>Patient History</h1>
-            <a href="/" class="btn btn-primary mb-4">Back to Questionnaire</a>
-            <!-- Patient ID Dropdown -->
-            <div class="mb-4">
-                <label for="patientIdSelect" class="form-label">Select Patient ID</label>
-                <select class="form-select" id="patientIdSelect">
-                    <option value="">-- Select a Patient --</option>
-                </select>
-                <div id="noPatients" class="text-muted mt-2 d-none">No patients found.</div>
-            </div>
-            <!-- Patient Details -->
-            <div id="patientDetails" class="mb-4 d-none">
-                <h3>Patient Details</h3>
-                <table class="table table-bordered">
-                    <thead>
-                        <tr>
-                            <th>Question ID</th>
-                            <th>Question Text</th>
-                            <th>Type</th>
-                            <th>Answer</th>
-                        </tr>
-                    </thead>
-                    <tbody id="detailsTableBody"></tbody>
-                </table>
-            </div>
-            <div id="error" class="alert alert-danger d-none mt-3" role="alert"></div>
-        </div>
-        <script>
-            // Populate patient ID dropdown
-            async function loadPatientIds() {
-                try {
-                    const response = await fetch('/get-patient-ids');
-                    const select = document.getElementById('patientIdSelect');
-                    const noPatientsDiv = document.getElementById('noPatients');
-                    select.innerHTML = '<option value="">-- Select a Patient --</option>';
-                    if (response.ok) {
-                        const patientIds = await response.json();
-                        if (patientIds.length === 0) {
-                            noPatientsDiv.classList.remove('d-none');
-                        } else {
-                            noPatientsDiv.classList.add('d-none');
-                            patientIds.forEach(id => {
-                                const option = document.createElement('option');
-                                option.value = id;
-                                option.textContent = id;
-                                select.appendChild(option);
-                            });
-                            console.log('Loaded patient IDs:', patientIds);
-                        }
-                    } else {
-                        console.error('Failed to load patient IDs:', await response.text());
-                        noPatientsDiv.classList.remove('d-none');
-                    }
-                } catch (error) {
-                    console.error('Error loading patient IDs:', error);
-                    document.getElementById('noPatients').classList.remove('d-none');
-                }
-            }
-
-            // Load patient details
-            async function loadPatientDetails(patientId) {
-                const detailsDiv = document.getElementById('patientDetails');
-                const tableBody = document.getElementById('detailsTableBody');
-                const errorDiv = document.getElementById('error');
-                tableBody.innerHTML = '';
-                errorDiv.classList.add('d-none');
-                if (!patientId) {
-                    detailsDiv.classList.add('d-none');
-                    return;
-                }
-                try {
-                    const response = await fetch(`/get-details/${patientId}`);
-                    if (response.ok) {
-                        const data = await response.json();
-                        data.details.forEach(detail => {
-                            const row = document.createElement('tr');
-                            row.innerHTML = `
-                                <td>${detail.question_id}</td>
-                                <td>${detail.text}</td>
-                                <td>${detail.type}</td>
-                                <td>${detail.answer}</td>
-                            `;
-                            tableBody.appendChild(row);
-                        });
-                        detailsDiv.classList.remove('d-none');
-                    } else {
-                        detailsDiv.classList.add('d-none');
-                        errorDiv.textContent = `Error: ${await response.text()}`;
-                        errorDiv.classList.remove('d-none');
-                    }
-                } catch (error) {
-                    detailsDiv.classList.add('d-none');
-                    errorDiv.textContent = `Error fetching details: ${error.message}`;
-                    errorDiv.classList.remove('d-none');
-                }
-            }
-
-            // Patient ID dropdown change
-            document.getElementById('patientIdSelect').addEventListener('change', (e) => {
-                loadPatientDetails(e.target.value);
-            });
-
-            // Initialize
-            loadPatientIds();
-        </script>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
+async def get_history(request: Request):
+    return serve_static_page(request, _HISTORY_PAGE)
 
 # from fastapi import FastAPI, Depends, HTTPException
 # from fastapi.responses import HTMLResponse
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, JSON, Enum, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, JSON, Enum, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -21,16 +21,30 @@ class Question(Base):
 class QuestionDependency(Base):
     __tablename__ = "question_dependencies"
     id = Column(Integer, primary_key=True)
-    question_id = Column(String, ForeignKey("questions.id"), nullable=False)
+    question_id = Column(String, ForeignKey("questions.id"), nullable=False, index=True)
     depends_on_question_id = Column(String, nullable=False)
     depends_on_answer = Column(String, nullable=False)
     question = relationship("Question", back_populates="dependencies")
 
+class CatalogVersion(Base):
+    # Single row, bumped whenever load_csv_to_db() rewrites the questions, so each
+    # worker can tell its in-process catalog is out of date.
+    __tablename__ = "catalog_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+
 class PatientAnswer(Base):
     __tablename__ = "patient_answers"
+    __table_args__ = (
+        # One answer per question per patient; target of the answer upsert.
+        Index("uq_patient_question", "patient_id", "question_id", unique=True),
+    )
     id = Column(Integer, primary_key=True)
     patient_id = Column(String, nullable=False)
     question_id = Column(String, ForeignKey("questions.id"), nullable=False)
     answer = Column(JSON, nullable=False)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
-    question = relationship("Question")
\ No newline at end of file
+    question = relationship("Question")
+# Latest activity per patient (patient id list, newest first); created_at is
+# descending so DISTINCT ON (patient_id) ... ORDER BY created_at DESC reads it in order.
+Index("ix_patient_created", PatientAnswer.patient_id, PatientAnswer.created_at.desc())